@@ -1,26 +1,56 @@
+import sys
+from types import MappingProxyType
+
 TRANSACTION_TYPES = ['Income', 'Expense', 'To Receive', 'To Pay']
 
+# Labels that appear in more than one place: bind each once so every
+# occurrence is the same interned str object rather than a fresh literal
+_MAINTENANCE = sys.intern('Maintenance')
+_OTHER = sys.intern('Other')
+_MISC = sys.intern('Miscellaneous')
+_UTILITIES = sys.intern('Utilities')
+_RENT = sys.intern('Rent')
+
 CATEGORIES = {
     'Expense': {
         'Food': ['Groceries', 'Dining Out', 'Snacks'],
-        'Transportation': ['Fuel', 'Public Transit', 'Maintenance'],
-        'Housing': ['Rent', 'Utilities', 'Maintenance'],
+        'Transportation': ['Fuel', 'Public Transit', _MAINTENANCE],
+        'Housing': [_RENT, _UTILITIES, _MAINTENANCE],
         'Entertainment': ['Movies', 'Games', 'Events'],
         'Shopping': ['Clothes', 'Electronics', 'Home Items'],
         'Healthcare': ['Medical', 'Pharmacy', 'Insurance'],
-        'Gift': ['Birthday', 'Wedding', 'Holiday', 'Other'],
-        'Other': ['Miscellaneous', 'Unspecified']
+        'Gift': ['Birthday', 'Wedding', 'Holiday', _OTHER],
+        _OTHER: [_MISC, 'Unspecified']
     },
     'Income': {
         'Salary': ['Regular', 'Bonus', 'Overtime'],
         'Investment': ['Dividends', 'Interest', 'Capital Gains'],
-        'Other': ['Gifts', 'Refunds', 'Miscellaneous']
+        _OTHER: ['Gifts', 'Refunds', _MISC]
     },
     'To Receive': {
-        'Pending Income': ['Salary', 'Investment', 'Other']
+        'Pending Income': ['Salary', 'Investment', _OTHER]
     },
     'To Pay': {
-        'Bills': ['Utilities', 'Rent', 'Other'],
-        'Debt': ['Credit Card', 'Loan', 'Other']
+        'Bills': [_UTILITIES, _RENT, _OTHER],
+        'Debt': ['Credit Card', 'Loan', _OTHER]
     }
-}
\ No newline at end of file
+}
+
+# Intern every label so equality checks during validation, filtering and
+# groupby collapse to pointer comparison, and rows held in session state
+# share one str object per label instead of fresh copies. The structure is
+# frozen to read-only proxies and tuples: these constants are shared across
+# every Streamlit session, so nothing should be able to mutate them
+TRANSACTION_TYPES = [sys.intern(t) for t in TRANSACTION_TYPES]
+CATEGORIES = MappingProxyType({
+    sys.intern(t): MappingProxyType(
+        {sys.intern(c): tuple(sys.intern(s) for s in subs) for c, subs in cats.items()}
+    )
+    for t, cats in CATEGORIES.items()
+})
+
+# Lookup tables built once at import so validation is a single hashed
+# membership test instead of nested dict indexing plus a list scan
+SUBCATEGORIES = {(t, c): frozenset(subs) for t, cats in CATEGORIES.items() for c, subs in cats.items()}
+CATEGORY_OF = {(t, sub): c for t, cats in CATEGORIES.items() for c, subs in cats.items() for sub in subs}
+VALID_CATEGORIES = {t: frozenset(cats) for t, cats in CATEGORIES.items()}
\ No newline at end of file
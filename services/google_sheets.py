@@ -1,19 +1,532 @@
+import atexit
+import concurrent.futures
+import functools
+import gzip
+import json
 import logging
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+import random
+import threading
+import time
 import os
 import streamlit as st
 from typing import List, Any
+from urllib.parse import quote
+
+from config.constants import SUBCATEGORIES
+
+try:
+    import orjson  # optional - C JSON encoder, used when installed
+except ImportError:
+    orjson = None
+
+# Transient statuses worth retrying: 429 quota exhaustion and 5xx hiccups
+_RETRYABLE_STATUSES = {429, 500, 502, 503}
+
+class SheetsWriteError(Exception):
+    """
+    A Sheets write failed after retries (or with a non-retryable status).
+
+    Carries the HTTP status, the Retry-After header and the response body
+    so callers can act on the semantics instead of parsing a message
+    string that a generic Exception would have flattened them into.
+    """
+    __slots__ = ('status', 'retry_after', 'body')
+
+    def __init__(self, status: Any, retry_after: Any, body: Any) -> None:
+        super().__init__(f"Sheets write failed with HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+        self.body = body
+
+def _enable_orjson() -> None:
+    """
+    Swap googleapiclient's stdlib json for orjson when it's installed.
+
+    JSON encoding is the dominant CPU cost for large batch bodies (e.g.
+    thousands of CSV-import rows); orjson serializes in C and writes bytes
+    directly. With orjson absent this is a no-op.
+    """
+    if orjson is None:
+        return
+    import googleapiclient.model as _model
+
+    class _OrjsonShim:
+        @staticmethod
+        def dumps(obj: Any, *args: Any, **kwargs: Any) -> str:
+            return orjson.dumps(obj).decode()
+
+        @staticmethod
+        def loads(s: Any, *args: Any, **kwargs: Any) -> Any:
+            return orjson.loads(s)
+
+    _model.json = _OrjsonShim()
+
+# Refresh the OAuth token before its ~60 minute expiry so the refresh
+# round trip never lands on a user-facing request
+_REFRESH_INTERVAL = 45 * 60  # seconds
+
+def _schedule_refresh(creds: Any) -> None:
+    """Refresh credentials on a background timer and reschedule"""
+    def _refresh() -> None:
+        try:
+            import google.auth.transport.requests
+            creds.refresh(google.auth.transport.requests.Request())
+            _store_creds(creds)
+        except Exception:
+            pass  # next API call refreshes lazily as before
+        _schedule_refresh(creds)
+    timer = threading.Timer(_REFRESH_INTERVAL, _refresh)
+    timer.daemon = True
+    timer.start()
+
+def _creds_cache_path(cred_path: str) -> str:
+    """Per-credential-file cache location, keyed by the file's content hash
+    so rotating the key on disk automatically invalidates the cache"""
+    import hashlib
+    import tempfile
+    with open(cred_path, 'rb') as f:
+        key = hashlib.md5(f.read()).hexdigest()
+    return os.path.join(tempfile.gettempdir(), f'sheets_creds_{key}.pkl')
+
+def _store_creds(creds: Any) -> None:
+    """Best-effort pickle of credentials that hold a live token.
+
+    Only worth doing once a token has been fetched - a freshly built
+    Credentials object has token=None, is never creds.valid on reload,
+    and caching it would be dead weight."""
+    if not creds.valid:
+        return
+    try:
+        import pickle
+        cache_path = _creds_cache_path(os.getenv('GOOGLE_SHEETS_CRED_PATH')) # type: ignore
+        fd = os.open(cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(creds, f)
+    except Exception:
+        pass  # caching is best-effort; the in-memory creds still work
+
+@functools.lru_cache(maxsize=1)
+def _get_credentials() -> Any:
+    """
+    Load service-account credentials once per process.
+
+    st.cache_resource is per-process and Streamlit Cloud restarts workers
+    freely, so a warm restart would otherwise pay the OAuth token round
+    trip again. The Credentials object (never the http transport or the
+    built service - those don't pickle) is cached in the temp dir; a
+    stale or unreadable pickle just falls through to a fresh load.
+    """
+    import pickle
+    from google.oauth2 import service_account
+    cred_path: str = os.getenv('GOOGLE_SHEETS_CRED_PATH') # type: ignore
+    cache_path = _creds_cache_path(cred_path)
+    try:
+        with open(cache_path, 'rb') as f:
+            creds = pickle.load(f)
+        if creds.valid:
+            _schedule_refresh(creds)
+            return creds
+    except Exception:
+        pass  # no cache yet, or an unpicklable/expired leftover
+    with open(cred_path) as f:
+        sa_info = json.load(f)
+    creds: Any = service_account.Credentials.from_service_account_info( # type: ignore
+        sa_info,
+        scopes=['https://www.googleapis.com/auth/spreadsheets']
+    )
+    _schedule_refresh(creds)
+    return creds
+
+# A sheets v4 discovery doc downloaded once and shipped next to this module
+# (optional - the client's bundled doc is used when it's absent)
+_DISCOVERY_DOC_PATH = os.path.join(os.path.dirname(__file__), 'sheets_v4_discovery.json')
+
+@functools.lru_cache(maxsize=1)
+def _get_authorized_http() -> Any:
+    """One authorized transport per process so every .execute() reuses the
+    same TLS connection instead of handshaking per call"""
+    import google_auth_httplib2
+    import httplib2
+    return google_auth_httplib2.AuthorizedHttp(
+        _get_credentials(), http=httplib2.Http(timeout=30)
+    )
+
+@functools.lru_cache(maxsize=1)
+def _build_service() -> Any:
+    """Build the Sheets service exactly once per process - lru_cache is
+    process-wide, while st.cache_resource alone is per Streamlit runtime"""
+    from googleapiclient.discovery import build
+    _enable_orjson()
+    http = _get_authorized_http()
+    # Prefer the local discovery doc so build never touches the network;
+    # otherwise static_discovery falls back to the doc bundled with the
+    # client, which also avoids the ~300ms fetch over HTTP at first use
+    if os.path.exists(_DISCOVERY_DOC_PATH):
+        from googleapiclient.discovery import build_from_document
+        with open(_DISCOVERY_DOC_PATH) as f:
+            return build_from_document(f.read(), http=http)
+    return build('sheets', 'v4', http=http,
+                 cache_discovery=False, static_discovery=True)
 
 @st.cache_resource
 def get_sheets_service():
     """Cache Google Sheets service configuration"""
     try:
-        creds = service_account.Credentials.from_service_account_file( # type: ignore
-            os.getenv('GOOGLE_SHEETS_CRED_PATH'), 
-            scopes=['https://www.googleapis.com/auth/spreadsheets']
-        )
-        service: Any = build('sheets', 'v4', credentials=creds)
+        service: Any = _build_service()
         return service
     except Exception as e:
-        raise e
\ No newline at end of file
+        raise e
+
+class TokenBucket:
+    """
+    Monotonic-time token bucket used to smooth write bursts.
+
+    Sized to the documented Sheets quota so we wait a few hundred ms
+    client-side instead of burning a round trip on a 429 and backing off.
+    """
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.ts = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> None:
+        """Consume one token, sleeping until one is available.
+
+        The sleep happens outside the lock so other writers (including the
+        executor's background threads) aren't stalled behind it, and accrual
+        restarts from a fresh timestamp on wake-up so the slept interval
+        isn't credited twice."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+                self.ts = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Sheets allows 60 write requests per user per minute
+_bucket = TokenBucket(rate=60 / 60, capacity=60)
+
+def _retry_delay(retry_after: Any, attempt: int, base: float, max_backoff: float) -> float:
+    """Backoff delay for one retry attempt.
+
+    Honors a Retry-After header in either legal form - delta-seconds or an
+    HTTP-date - and falls back to exponential backoff with jitter when the
+    header is absent or unparseable."""
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                from email.utils import parsedate_to_datetime
+                from datetime import datetime, timezone
+                target = parsedate_to_datetime(retry_after)
+                return max(0.0, (target - datetime.now(timezone.utc)).total_seconds())
+            except Exception:
+                pass  # malformed header - use the computed backoff
+    return min(max_backoff, base * (2 ** attempt)) + random.random()
+
+def _execute_with_retry(request: Any, max_retries: int = 7, base: float = 0.5, max_backoff: float = 32.0) -> Any:
+    """
+    Execute a googleapiclient request, retrying transient HTTP failures.
+
+    Retries 429/500/502/503 with exponential backoff plus jitter so the
+    Sheets per-user write quota turns into a short wait instead of a hard
+    failure. Honors a Retry-After header when the server sends one.
+    """
+    from googleapiclient.errors import HttpError
+    for attempt in range(max_retries):
+        try:
+            return request.execute()
+        except HttpError as e:
+            if e.resp.status not in _RETRYABLE_STATUSES or attempt == max_retries - 1:
+                raise SheetsWriteError(e.resp.status, e.resp.get('retry-after'), e.content) from e
+            delay = _retry_delay(e.resp.get('retry-after'), attempt, base, max_backoff)
+            time.sleep(delay)
+
+# The hot write path only ever calls values.append, so we can POST to the
+# REST endpoint directly - same wire protocol, without googleapiclient's
+# per-call method construction and parameter validation overhead
+_APPEND_URL = ('https://sheets.googleapis.com/v4/spreadsheets/{sid}/values/'
+               '{rng}:append?valueInputOption=RAW&insertDataOption=INSERT_ROWS')
+
+# Bodies below this aren't worth compressing - gzip overhead eats the gain
+_GZIP_THRESHOLD = 4096
+
+@functools.lru_cache(maxsize=1)
+def _get_session() -> Any:
+    """requests.Session with a pooled adapter so TLS is amortized"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=10))
+    return session
+
+def _auth_header() -> dict[str, str]:
+    """Bearer header from the cached credentials, refreshing when stale"""
+    creds = _get_credentials()
+    if not creds.valid:
+        import google.auth.transport.requests
+        creds.refresh(google.auth.transport.requests.Request())
+        _store_creds(creds)
+    return {'Authorization': f'Bearer {creds.token}'}
+
+def _cells_equal(a: Any, b: Any) -> bool:
+    """Numeric-aware cell comparison: UNFORMATTED_VALUE hands integral
+    numbers back as ints while rows are sent with float amounts, so 500
+    has to match 500.0; everything else falls back to string equality"""
+    try:
+        return float(a) == float(b)
+    except (TypeError, ValueError):
+        return str(a) == str(b)
+
+def _rows_already_appended(sheet_id: str, sheet_name: str, values: List[List[Any]]) -> bool:
+    """
+    Check whether an ambiguous append actually committed server-side.
+
+    values.append has no requestId-style dedup token, so after a 5xx (where
+    the row may have been written before the error) the only safe way to
+    retry is to compare the rows against the tail of the sheet first.
+    """
+    try:
+        url = ('https://sheets.googleapis.com/v4/spreadsheets/{sid}/values/{rng}'
+               '?valueRenderOption=UNFORMATTED_VALUE').format(sid=sheet_id, rng=quote(sheet_name))
+        resp = _get_session().get(url, headers=_auth_header(), timeout=30)
+        if resp.status_code >= 300:
+            return False
+        existing = resp.json().get('values', [])
+        if len(existing) < len(values):
+            return False
+        tail = existing[-len(values):]
+        return all(
+            len(got) == len(sent) and all(_cells_equal(a, b) for a, b in zip(got, sent))
+            for got, sent in zip(tail, values)
+        )
+    except Exception:
+        return False
+
+def _append_rest(sheet_id: str, sheet_name: str, values: List[List[Any]],
+                 max_retries: int = 7, base: float = 0.5, max_backoff: float = 32.0) -> Any:
+    """POST an append straight to the Sheets REST endpoint, with the same
+    backoff policy as _execute_with_retry and dedup on ambiguous retries"""
+    session = _get_session()
+    url = _APPEND_URL.format(sid=sheet_id, rng=quote(sheet_name))
+    if orjson is not None:
+        body = orjson.dumps({'values': values})
+    else:
+        body = json.dumps({'values': values}).encode()
+    extra_headers = {'Content-Type': 'application/json'}
+    # Category names recur, so bulk bodies gzip to a fraction of their size;
+    # level 1 costs almost no CPU and upload bandwidth is the bottleneck
+    if len(body) > _GZIP_THRESHOLD:
+        body = gzip.compress(body, compresslevel=1)
+        extra_headers['Content-Encoding'] = 'gzip'
+    for attempt in range(max_retries):
+        resp = session.post(url, data=body, headers={**_auth_header(), **extra_headers}, timeout=30)
+        if resp.status_code < 300:
+            return resp.json()
+        if resp.status_code not in _RETRYABLE_STATUSES or attempt == max_retries - 1:
+            raise SheetsWriteError(
+                resp.status_code, resp.headers.get('Retry-After'), resp.content
+            )
+        delay = _retry_delay(resp.headers.get('Retry-After'), attempt, base, max_backoff)
+        time.sleep(delay)
+        # 5xx is ambiguous - the append may have committed before the error,
+        # and blindly retrying would duplicate the row (429 is a clean reject)
+        if resp.status_code >= 500 and _rows_already_appended(sheet_id, sheet_name, values):
+            return {'deduplicated': True}
+
+# Expenses row layout: [date, amount, type, category, subcategory, description]
+IDX_TYPE, IDX_CAT, IDX_SUB = 2, 3, 4
+
+# Combinations the app writes internally but doesn't offer in the category
+# tables: the received-pending flow records the income leg of a settled
+# Pending row with this marker subcategory
+_INTERNAL_COMBOS = {('Income', 'Other', 'Pending Received')}
+
+def _validate(row: List[Any]) -> None:
+    """
+    Reject invalid type/category/subcategory combinations locally.
+
+    A bad row otherwise costs a full network round trip (and a unit of
+    write quota) before the problem surfaces - or worse, gets silently
+    written. One dict lookup plus one frozenset membership test per row.
+    """
+    t, c, sub = row[IDX_TYPE], row[IDX_CAT], row[IDX_SUB]
+    if sub not in SUBCATEGORIES.get((t, c), ()) and (t, c, sub) not in _INTERNAL_COMBOS:
+        raise ValueError(f"Invalid transaction combination: {t}/{c}/{sub}")
+
+def add_transaction(service: Any, sheet_id: str | None, sheet_name: str, values: List[List[Any]]) -> Any:
+    """
+    Append transaction rows to a sheet, retrying transient errors.
+
+    Args:
+        service: Sheets API service from get_sheets_service
+        sheet_id: Spreadsheet ID
+        sheet_name: Target sheet title, e.g. 'Expenses'
+        values: Rows to append; amounts should be numbers, not strings
+
+    Returns:
+        The append response from the Sheets API.
+
+    Rows are written RAW: callers type their cells client-side (floats for
+    amounts), so the backend skips its typed-as-typed-by-a-user inference
+    pass and can't silently mis-coerce a value.
+    """
+    if sheet_name == 'Expenses':
+        for row in values:
+            _validate(row)
+    _bucket.take()
+    try:
+        return _append_rest(str(sheet_id), sheet_name, values)
+    except ImportError:
+        # requests unavailable - fall back to the discovery client
+        request = service.spreadsheets().values().append(
+            spreadsheetId=sheet_id,
+            range=sheet_name,
+            valueInputOption='RAW',
+            insertDataOption='INSERT_ROWS',
+            body={'values': values}
+        )
+        return _execute_with_retry(request)
+
+# Background uploads: the append round trip is ~160ms, long enough to block
+# the UI thread while the user could already be typing the next transaction
+_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+_in_flight: list[concurrent.futures.Future] = []
+_in_flight_lock = threading.Lock()
+
+def add_transaction_async(service: Any, sheet_id: str, sheet_name: str,
+                          values: List[List[Any]]) -> concurrent.futures.Future:
+    """
+    Submit an append to a background thread and return its Future.
+
+    The UI can re-render while the upload runs; call wait_for_pending()
+    before reads that must observe the write, or check the Future for the
+    result. Callers that need the outcome before confirming to the user
+    should keep using the synchronous add_transaction.
+    """
+    future = _EXECUTOR.submit(add_transaction, service, sheet_id, sheet_name, values)
+    with _in_flight_lock:
+        _in_flight.append(future)
+        _in_flight[:] = [f for f in _in_flight if not f.done()]
+    return future
+
+def wait_for_pending(timeout: float | None = None) -> None:
+    """Block until all background appends submitted so far have finished"""
+    with _in_flight_lock:
+        futures = list(_in_flight)
+    concurrent.futures.wait(futures, timeout=timeout)
+
+def add_transactions_multisheet(service: Any, sheet_id: str, writes: dict[str, List[List[Any]]]) -> dict[str, Any]:
+    """
+    Append rows to several sheets, one retried append call per sheet.
+
+    values.batchUpdate writes from the top of each range - it would
+    clobber the header row and oldest data, not append - so each sheet
+    gets its own values.append through add_transaction, sharing its RAW
+    typing, rate limiting and retry behavior.
+
+    Args:
+        service: Sheets API service from get_sheets_service
+        sheet_id: Spreadsheet ID
+        writes: Mapping of sheet title -> rows for that sheet
+
+    Returns:
+        Mapping of sheet title -> append response.
+
+    Callers with prebuilt row sets for multiple sheets (e.g. a CSV import
+    that produces both Expenses and Pending rows) still batch all rows
+    for a sheet into a single call instead of one append per row.
+    """
+    return {
+        sheet_name: add_transaction(service, sheet_id, sheet_name, rows)
+        for sheet_name, rows in writes.items()
+    }
+
+# Batched writes: rows queue up per (sheet_id, sheet_name) and go out in one
+# values.append per batch, instead of one HTTP round trip per transaction
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 5.0  # seconds
+
+_pending: dict[tuple[str, str], list[list[Any]]] = {}
+_pending_services: dict[tuple[str, str], Any] = {}
+_last_flush: dict[tuple[str, str], float] = {}
+_pending_lock = threading.Lock()
+_flusher_started = False
+
+def _start_flusher() -> None:
+    """Start the daemon timer that flushes stale queues.
+
+    Without it a partial batch (e.g. one queued row) only goes out when the
+    next row arrives - which may be never - and the atexit hook doesn't run
+    when a cloud worker is killed. The timer re-arms itself after each pass."""
+    global _flusher_started
+    with _pending_lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+
+    def _tick() -> None:
+        now = time.monotonic()
+        with _pending_lock:
+            stale = [key for key, rows in _pending.items()
+                     if rows and now - _last_flush.get(key, 0.0) > FLUSH_INTERVAL]
+        for sheet_id, sheet_name in stale:
+            try:
+                _flush(sheet_id, sheet_name)
+            except Exception as e:
+                logging.getLogger(__name__).error(f"❌ Background flush failed for {sheet_name}: {str(e)}")
+        timer = threading.Timer(FLUSH_INTERVAL, _tick)
+        timer.daemon = True
+        timer.start()
+
+    timer = threading.Timer(FLUSH_INTERVAL, _tick)
+    timer.daemon = True
+    timer.start()
+
+def queue_transaction(service: Any, sheet_id: str, sheet_name: str, row: List[Any]) -> None:
+    """
+    Queue a row for a batched append.
+
+    The queue flushes once BATCH_SIZE rows are waiting or FLUSH_INTERVAL
+    seconds have passed since the last flush for that sheet. Bulk callers
+    (e.g. CSV import) should use this instead of add_transaction per row
+    to stay under the per-100s write quota.
+    """
+    if sheet_name == 'Expenses':
+        _validate(row)
+    _start_flusher()
+    key = (sheet_id, sheet_name)
+    with _pending_lock:
+        _pending.setdefault(key, []).append(row)
+        _pending_services[key] = service
+        last = _last_flush.setdefault(key, time.monotonic())
+        should_flush = (len(_pending[key]) >= BATCH_SIZE
+                        or time.monotonic() - last > FLUSH_INTERVAL)
+    if should_flush:
+        _flush(sheet_id, sheet_name)
+
+def _flush(sheet_id: str, sheet_name: str) -> None:
+    """Send any queued rows for one sheet in a single append call"""
+    key = (sheet_id, sheet_name)
+    with _pending_lock:
+        rows = _pending.pop(key, [])
+        service = _pending_services.get(key)
+        _last_flush[key] = time.monotonic()
+    if rows and service is not None:
+        add_transaction(service, sheet_id, sheet_name, rows)
+
+def _flush_all() -> None:
+    """Flush every queue so rows aren't lost when the script exits"""
+    with _pending_lock:
+        keys = list(_pending.keys())
+    for sheet_id, sheet_name in keys:
+        _flush(sheet_id, sheet_name)
+
+atexit.register(_flush_all)
\ No newline at end of file
@@ -0,0 +1,52 @@
+import services.google_sheets as gs
+
+
+class _FakeResponse:
+    def __init__(self, rows):
+        self.status_code = 200
+        self._rows = rows
+
+    def json(self):
+        return {'values': self._rows}
+
+
+class _FakeSession:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def get(self, url, headers=None, timeout=None):
+        return _FakeResponse(self._rows)
+
+
+def _patch_transport(monkeypatch, rows):
+    monkeypatch.setattr(gs, '_get_session', lambda: _FakeSession(rows))
+    monkeypatch.setattr(gs, '_auth_header', lambda: {})
+
+
+def test_cells_equal_integral_amounts():
+    # Sheets returns 500 for a cell sent as 500.0
+    assert gs._cells_equal(500, 500.0)
+    assert gs._cells_equal('500', 500.0)
+    assert not gs._cells_equal(500, 501.0)
+    assert gs._cells_equal('lunch', 'lunch')
+    assert not gs._cells_equal('lunch', 'dinner')
+
+
+def test_rows_already_appended_matches_integral_amount(monkeypatch):
+    sheet = [
+        ['Date', 'Amount', 'Type', 'Category', 'Subcategory', 'Description'],
+        ['2026-09-01', 500, 'Expense', 'Food', 'Groceries', 'lunch'],
+    ]
+    _patch_transport(monkeypatch, sheet)
+    sent = [['2026-09-01', 500.0, 'Expense', 'Food', 'Groceries', 'lunch']]
+    assert gs._rows_already_appended('sid', 'Expenses', sent)
+
+
+def test_rows_already_appended_rejects_different_row(monkeypatch):
+    sheet = [
+        ['Date', 'Amount', 'Type', 'Category', 'Subcategory', 'Description'],
+        ['2026-09-01', 250, 'Expense', 'Food', 'Snacks', 'coffee'],
+    ]
+    _patch_transport(monkeypatch, sheet)
+    sent = [['2026-09-01', 500.0, 'Expense', 'Food', 'Groceries', 'lunch']]
+    assert not gs._rows_already_appended('sid', 'Expenses', sent)
@@ -1,14 +1,26 @@
-from rich.console import Console
-from rich.logging import RichHandler
 import logging
+import os
 
 def setup_logging(logger_name: str) -> logging.Logger:
-    """Configure and return a Rich logger"""
-    console = Console()
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(message)s",
-        datefmt="[%X]",
-        handlers=[RichHandler(console=console, rich_tracebacks=True)]
-    )
-    return logging.getLogger(logger_name)
\ No newline at end of file
+    """Configure and return a logger.
+
+    Defaults to a plain StreamHandler at WARNING - RichHandler pushes every
+    record through a console lock and syntax highlighter, which is too heavy
+    for Streamlit's rerun-per-interaction model. Set DEBUG=1 to get the Rich
+    handler back with debug-level output.
+    """
+    if os.getenv('DEBUG'):
+        from rich.console import Console
+        from rich.logging import RichHandler
+        logging.basicConfig(
+            level=logging.DEBUG,
+            format="%(message)s",
+            datefmt="[%X]",
+            handlers=[RichHandler(console=Console(), rich_tracebacks=True)]
+        )
+    else:
+        logging.basicConfig(
+            level=logging.WARNING,
+            format="%(asctime)s %(levelname)s %(message)s"
+        )
+    return logging.getLogger(logger_name)